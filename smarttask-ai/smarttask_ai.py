@@ -13,7 +13,7 @@ import os
 import sqlite3
 import webbrowser
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta
 
 def check_and_install_dependencies():
     """
@@ -61,6 +61,10 @@ except ImportError:
     print("\nDependencies installed. Please restart the application.")
     sys.exit(0)
 
+# Reminder colours for the task list, built once instead of per row.
+BRUSH_OVERDUE = QBrush(QColor("#e57373"))  # Red
+BRUSH_DUE_SOON = QBrush(QColor("#ffb74d"))  # Orange
+
 class MainWindow(QMainWindow):
     """
     Main application window for the SmartTask AI Assistant.
@@ -331,17 +335,15 @@ class MainWindow(QMainWindow):
         """Loads tasks and applies reminder colors."""
         self.task_list_widget.clear()
         now = datetime.now()
-        for row in self.db_conn.cursor().execute("SELECT id, description, due_date FROM tasks WHERE status='pending' ORDER BY due_date ASC"):
-            task_id, description, due_date_str = row
-            display_text = f"{description}"
-            if due_date_str:
-                due_date = datetime.fromisoformat(due_date_str)
-                display_text += f" (Due: {due_date.strftime('%Y-%m-%d %H:%M')})"
-            item = QListWidgetItem(display_text)
+        soon_cutoff = now + timedelta(days=1)
+        rows = self.db_conn.execute("SELECT id, description, due_date FROM tasks WHERE status='pending' ORDER BY due_date ASC").fetchall()
+        for task_id, description, due_date_str in rows:
+            due_date = datetime.fromisoformat(due_date_str) if due_date_str else None
+            item = QListWidgetItem(f"{description} (Due: {due_date.isoformat(' ', 'minutes')})" if due_date else description)
             item.setData(Qt.ItemDataRole.UserRole, task_id)
-            if due_date_str:
-                if due_date < now: item.setForeground(QBrush(QColor("#e57373"))) # Red
-                elif (due_date - now).days < 1: item.setForeground(QBrush(QColor("#ffb74d"))) # Orange
+            if due_date:
+                if due_date < now: item.setForeground(BRUSH_OVERDUE)
+                elif due_date < soon_cutoff: item.setForeground(BRUSH_DUE_SOON)
             self.task_list_widget.addItem(item)
     def add_task(self):
         """Adds a new task to the database."""
@@ -6,38 +6,65 @@
 # A premium AI-powered productivity suite designed to streamline your workflow.
 
 # --- Core Python Libraries ---
-import importlib.util
+import importlib.metadata
 import subprocess
 import sys
 import os
 import sqlite3
+import io
 import json
+import re
+import hashlib
+import html
+import threading
+import time
 import webbrowser
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
-import csv
 
 # --- Dependency Management ---
 
-def check_and_install_dependencies():
+# Written after a successful dependency check so later launches can skip it.
+DEPS_SENTINEL = os.path.join(os.path.expanduser("~"), ".smarttask", "deps_ok")
+
+def is_package_installed(package):
+    """Returns True if a distribution with this pip name is installed."""
+    try:
+        importlib.metadata.distribution(package)
+        return True
+    except importlib.metadata.PackageNotFoundError:
+        return False
+
+def check_and_install_dependencies(force=False):
     """
     Checks for required packages and installs them if missing.
     This makes the script portable and easier to run by ensuring all
     necessary third-party libraries are available.
+
+    A successful check is recorded in DEPS_SENTINEL, stamped with the Python
+    version and package list, so later launches return immediately as long
+    as the sentinel is newer than this script. Pass force=True to check
+    regardless (e.g. after an import has failed).
     """
-    # A dictionary of package names for pip and their corresponding import names.
-    required_packages = {
-        "PyQt6": "PyQt6",
-        "requests": "requests",
-        "fpdf2": "fpdf",
-        "python-docx": "docx",
-        "PyPDF2": "PyPDF2"
-    }
+    # Frozen (PyInstaller) builds bundle their dependencies and cannot pip install.
+    if getattr(sys, 'frozen', False): return
+    # Distribution names as known to pip.
+    required_packages = ["PyQt6", "requests", "fpdf2", "python-docx", "PyPDF2", "pypdfium2"]
+    stamp = f"{sys.version}\n{','.join(required_packages)}"
+    if not force:
+        try:
+            if os.path.getmtime(DEPS_SENTINEL) >= os.path.getmtime(os.path.abspath(__file__)):
+                with open(DEPS_SENTINEL, 'r', encoding='utf-8') as f:
+                    if f.read() == stamp: return
+        except OSError:
+            pass
 
     print("--- SmartTask AI Assistant ---")
     print("Checking for required dependencies...")
     all_installed = True
-    for package, import_name in required_packages.items():
-        if importlib.util.find_spec(import_name) is None:
+    for package in required_packages:
+        if not is_package_installed(package):
             all_installed = False
             print(f"'{package}' is not installed. Attempting to install...")
             try:
@@ -53,32 +80,222 @@ def check_and_install_dependencies():
     if all_installed:
         print("All dependencies are satisfied.")
     print("-" * 30)
+    try:
+        os.makedirs(os.path.dirname(DEPS_SENTINEL), exist_ok=True)
+        with open(DEPS_SENTINEL, 'w', encoding='utf-8') as f: f.write(stamp)
+    except OSError:
+        pass
 
 # --- Main Application ---
 
 try:
     from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                                 QHBoxLayout, QListWidget, QTextEdit, QStatusBar,
+                                 QHBoxLayout, QListWidget, QListView, QTextEdit, QStatusBar,
                                  QPushButton, QLabel, QFrame, QStackedWidget,
-                                 QLineEdit, QListWidgetItem, QFormLayout, QComboBox,
-                                 QMessageBox, QFileDialog, QDateEdit)
-    from PyQt6.QtGui import QIcon
-    from PyQt6.QtCore import Qt, QSize, QDate
-    from docx import Document
-    from PyPDF2 import PdfReader
-    from fpdf import FPDF
+                                 QLineEdit, QFormLayout, QComboBox,
+                                 QMessageBox, QFileDialog, QDateEdit, QCheckBox, QStyledItemDelegate)
+    from PyQt6.QtGui import QIcon, QTextCursor, QTextCharFormat
+    from PyQt6.QtCore import Qt, QSize, QDate, QObject, QRunnable, QAbstractListModel, QModelIndex, QThreadPool, QTimer, pyqtSignal
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except ImportError:
-    check_and_install_dependencies()
+    check_and_install_dependencies(force=True)
     print("\nDependencies installed. Please restart the application.")
     sys.exit(0)
 
+# The document libraries (docx, PyPDF2, pypdfium2, fpdf) are imported where they are used,
+# so launching the app does not pay for modules a session may never need.
+
+# Applied to every new database connection: WAL journaling with NORMAL sync keeps
+# interactive commits cheap, the larger in-memory cache avoids re-reading pages, and
+# busy_timeout waits out a lock held by another instance instead of failing at once. It comes
+# first because the first-run switch to WAL itself needs that lock.
+SQLITE_PRAGMAS = ("PRAGMA busy_timeout=5000", "PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL",
+                  "PRAGMA temp_store=MEMORY", "PRAGMA mmap_size=268435456", "PRAGMA cache_size=-20000",
+                  "PRAGMA foreign_keys=ON")
+
+# --- Theme Stylesheets ---
+BASE_QSS = "QPushButton { border-radius: 5px; padding: 8px; font-weight: bold; } QListView, QTextEdit, QLineEdit, QDateEdit { border-radius: 5px; padding: 5px; } #SidebarTitle { font-size: 18pt; font-weight: bold; } #PageTitle { font-size: 14pt; font-weight: bold; margin-bottom: 10px; }"
+LIGHT_QSS = BASE_QSS + "QWidget { background-color: #f0f2f5; color: #333; } QTextEdit, QLineEdit, QListView, QDateEdit { background-color: #fff; border: 1px solid #d9d9d9; } QPushButton { background-color: #007bff; color: white; border: none; } QPushButton:hover { background-color: #0056b3; } QStatusBar { background-color: #e9ecef; } #sidebar { background-color: #fff; }"
+DARK_QSS = BASE_QSS + "QWidget { background-color: #1c1c1e; color: #f0f0f0; } QTextEdit, QLineEdit, QListView, QDateEdit { background-color: #2c2c2e; border: 1px solid #444; } QPushButton { background-color: #0a84ff; color: white; border: none; } QPushButton:hover { background-color: #0060df; } QStatusBar { background-color: #2c2c2e; } #sidebar { background-color: #232325; }"
+
+# Model selector entry that sends the prompt to every configured provider at once.
+ALL_MODELS = "All Models (compare)"
+
+# --- SQL ---
+SQL_SEED_CONFIG = "INSERT OR IGNORE INTO app_config VALUES (?, ?)"
+SQL_SET_CONFIG = "INSERT OR REPLACE INTO app_config VALUES (?, ?)"
+SQL_ALL_CONFIG = "SELECT key, value FROM app_config"
+SQL_ALL_API_KEYS = "SELECT service, api_key FROM api_keys"
+SQL_SAVE_API_KEY = "INSERT OR REPLACE INTO api_keys VALUES (?, ?)"
+SQL_DELETE_API_KEY = "DELETE FROM api_keys WHERE service=?"
+SQL_PENDING_TASKS = "SELECT id, description, due_date FROM tasks WHERE status='pending' ORDER BY due_date ASC, id DESC"
+SQL_INSERT_TASK = "INSERT INTO tasks (description, due_date) VALUES (?, ?)"
+SQL_DELETE_TASK = "DELETE FROM tasks WHERE id=?"
+SQL_GET_CACHED_RESPONSE = "SELECT response FROM llm_cache WHERE hash=? AND ts >= ?"
+SQL_CACHE_RESPONSE = "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)"
+SQL_PRUNE_CACHE = "DELETE FROM llm_cache WHERE ts < ?"
+
+# Cached AI responses older than this (in seconds) are ignored and pruned on startup.
+LLM_CACHE_TTL = 7 * 24 * 3600
+
+# Pro license keys: the SMARTTASK- prefix followed by at least six letters, digits or dashes.
+# Issued keys only use that charset, so this is deliberately stricter than the old prefix-and-length
+# check, which also let through keys containing '_', '.' or other punctuation.
+LICENSE_KEY_RE = re.compile(r"SMARTTASK-[A-Z0-9-]{6,}")
+
+# Extracted file text is cut off here (roughly 8k tokens), leaving room in the model's
+# context window for the question and the answer.
+MAX_CONTEXT_CHARS = 32_768
+# Extractors read one character past the budget so a cut-off file can be told apart from one that fits exactly.
+EXTRACT_LIMIT = MAX_CONTEXT_CHARS + 1
+TRUNCATED_MARKER = "[truncated]"
+
+def join_bounded(chunks, limit=EXTRACT_LIMIT):
+    """Joins text chunks with newlines, stopping as soon as limit characters have been written."""
+    buf = io.StringIO()
+    for chunk in chunks:
+        if buf.tell(): buf.write("\n")
+        buf.write(chunk)
+        if buf.tell() >= limit: break
+    return buf.getvalue()[:limit]
+
+# Dropped-file context is wrapped in these markers at the top of the prompt.
+CONTEXT_HEADER = "--- Context from {} ---"
+CONTEXT_FOOTER = "--- End of Context ---"
+
+def split_context(prompt):
+    """Splits a prompt into its leading file-context block and the user's question.
+
+    Returns ("", prompt) when there is no context block or no question after it.
+    """
+    if not prompt.startswith(CONTEXT_HEADER.split("{}")[0]): return "", prompt
+    # Split on the last footer line handle_extracted_text writes, so a file that itself
+    # contains the marker stays whole.
+    context, footer, question = prompt.rpartition(f"\n{CONTEXT_FOOTER}\n"); question = question.strip()
+    return (context + footer.rstrip("\n"), question) if footer and question else ("", prompt)
+
+# Unicode TTF used for PDF exports, looked up next to the script first, then in the working directory.
+PDF_FONT_FILE = "DejaVuSans.ttf"
+
+@lru_cache(maxsize=None)
+def get_pdf_font_path():
+    """Resolves the PDF font path once per process."""
+    bundled = os.path.join(os.path.dirname(os.path.abspath(__file__)), PDF_FONT_FILE)
+    return bundled if os.path.exists(bundled) else PDF_FONT_FILE
+
+# --- Background Workers ---
+
+class WorkerSignals(QObject):
+    """Signals used by background workers to hand results back to the GUI thread."""
+    chunk = pyqtSignal(str)
+    finished = pyqtSignal(str, str, str, str)
+
+class LLMWorker(QRunnable):
+    """Runs a blocking LLM query on a QThreadPool thread so the event loop keeps running."""
+    def __init__(self, query_fn, model_name, prompt, api_key, stream=True, cache_key=""):
+        super().__init__()
+        self.query_fn = query_fn; self.model_name = model_name; self.prompt = prompt; self.api_key = api_key; self.stream = stream
+        # Computed at send time; empty means the reply must not be cached.
+        self.cache_key = cache_key
+        self.signals = WorkerSignals()
+
+    def run(self):
+        # Always emit finished: the window keeps the Send button disabled until it arrives.
+        on_chunk = self.signals.chunk.emit if self.stream else None
+        try: response = self.query_fn(self.model_name, self.prompt, self.api_key, on_chunk)
+        except Exception as e: response = f"<font color='red'><b>Error:</b> {e}</font>"
+        self.signals.finished.emit(self.model_name, self.prompt, response, self.cache_key)
+
+class ExtractSignals(QObject):
+    """Signals emitted by ExtractWorker: (filepath, text) on success, (filepath, error) on failure."""
+    finished = pyqtSignal(str, str)
+    failed = pyqtSignal(str, str)
+
+class ExtractWorker(QRunnable):
+    """Extracts text from a dropped file on a QThreadPool thread; large PDFs can take seconds."""
+    def __init__(self, extract_fn, filepath):
+        super().__init__()
+        self.extract_fn = extract_fn; self.filepath = filepath
+        self.signals = ExtractSignals()
+
+    def run(self):
+        try: content = self.extract_fn(self.filepath)
+        except Exception as e: self.signals.failed.emit(self.filepath, str(e)); return
+        self.signals.finished.emit(self.filepath, content or "")
+
+class ExportSignals(QObject):
+    """Signal emitted by ExportWorker: (True, filepath) on success, (False, error) on failure."""
+    done = pyqtSignal(bool, str)
+
+class ExportWorker(QRunnable):
+    """Writes an exported chat file on a QThreadPool thread; PDF font embedding can take seconds."""
+    def __init__(self, export_fn, content, filepath):
+        super().__init__()
+        self.export_fn = export_fn; self.content = content; self.filepath = filepath
+        self.signals = ExportSignals()
+
+    def run(self):
+        try: self.export_fn(self.content, self.filepath)
+        except Exception as e: self.signals.done.emit(False, str(e)); return
+        self.signals.done.emit(True, self.filepath)
+
+# --- Models ---
+
+class TaskModel(QAbstractListModel):
+    """Pending tasks as plain (id, description, due_date) tuples, in SQL_PENDING_TASKS order."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        task_id, description, due_date = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole: return f"{description}  (Due: {due_date})" if due_date else description
+        if role == Qt.ItemDataRole.UserRole: return task_id
+        return None
+
+    def set_rows(self, rows):
+        self.beginResetModel(); self.rows = list(rows); self.endResetModel()
+
+    def sort_key(self, row):
+        # Mirrors ORDER BY due_date ASC, id DESC (SQLite sorts NULL dates first).
+        return (row[2] or "", -row[0])
+
+    def insert_task(self, task_id, description, due_date):
+        """Inserts a task at its sorted position with a binary search and returns that row."""
+        new_row = (task_id, description, due_date); key = self.sort_key(new_row); lo, hi = 0, len(self.rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sort_key(self.rows[mid]) <= key: lo = mid + 1
+            else: hi = mid
+        self.beginInsertRows(QModelIndex(), lo, lo); self.rows.insert(lo, new_row); self.endInsertRows()
+        return lo
+
+    def remove_task(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row); del self.rows[row]; self.endRemoveRows()
+
+class TaskItemDelegate(QStyledItemDelegate):
+    """Gives every task row the same one-line height, so the view never measures item text."""
+    def sizeHint(self, option, index):
+        return QSize(0, option.fontMetrics.height() + 6)
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setAcceptDrops(True)
         self.db_conn = None
         self.init_database()
+        self.http_adapter = self.create_http_adapter(); self._http_local = threading.local()
+        self._http_sessions = set(); self._http_sessions_lock = threading.Lock()
+        # File types that can be dropped onto the AI chat as context; add a handler here to support more.
+        self._extractors = {'.txt': self._extract_txt, '.csv': self._extract_csv, '.docx': self._extract_docx, '.pdf': self._extract_pdf}
+        # Month rollover is checked once a minute instead of on every query.
+        self._month_timer = QTimer(self); self._month_timer.timeout.connect(self.roll_query_month); self._month_timer.start(60_000)
         self.setWindowTitle("SmartTask AI Assistant")
         self.setGeometry(100, 100, 1200, 800)
         if os.path.exists("icon.ico"): self.setWindowIcon(QIcon("icon.ico"))
@@ -101,6 +318,11 @@ class MainWindow(QMainWindow):
         filepath = event.mimeData().urls()[0].toLocalFile()
         self.handle_file_drop(filepath)
 
+    def closeEvent(self, event):
+        with self._http_sessions_lock: sessions = list(self._http_sessions); self._http_sessions.clear()
+        for session in sessions: session.close()
+        self.http_adapter.close(); super().closeEvent(event)
+
     def change_page(self): self.pages.setCurrentIndex(self.nav_list.currentRow())
 
     # --- UI Setup ---
@@ -112,7 +334,7 @@ class MainWindow(QMainWindow):
         self.status_bar = QStatusBar(); self.setStatusBar(self.status_bar)
 
     def setup_sidebar(self):
-        self.sidebar = QWidget(); self.sidebar.setFixedWidth(200); self.sidebar_layout = QVBoxLayout(self.sidebar)
+        self.sidebar = QWidget(); self.sidebar.setObjectName("sidebar"); self.sidebar.setFixedWidth(200); self.sidebar_layout = QVBoxLayout(self.sidebar)
         self.sidebar_layout.setContentsMargins(10, 10, 10, 10); self.sidebar_layout.setSpacing(10); self.sidebar_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
         title = QLabel("SmartTask AI"); title.setObjectName("SidebarTitle")
         self.nav_list = QListWidget(); self.nav_list.addItems(["Tasks", "AI Chat", "Settings"])
@@ -128,25 +350,30 @@ class MainWindow(QMainWindow):
 
     def create_task_manager_page(self):
         page = QWidget(); layout = QVBoxLayout(page); layout.setContentsMargins(20, 20, 20, 20)
-        title = QLabel("Task Manager"); title.setObjectName("PageTitle"); self.task_list_widget = QListWidget(); self.load_tasks()
+        title = QLabel("Task Manager"); title.setObjectName("PageTitle"); self.task_model = TaskModel(self); self.task_view = QListView(); self.task_view.setModel(self.task_model); self.load_tasks()
+        # Tasks are single-line rows: uniform sizes let Qt lay out the list from one row's height.
+        self.task_view.setUniformItemSizes(True); self.task_view.setItemDelegate(TaskItemDelegate(self.task_view))
         input_layout = QHBoxLayout(); self.task_input = QLineEdit(); self.task_input.setPlaceholderText("Enter new task...")
         self.due_date_input = QDateEdit(self); self.due_date_input.setCalendarPopup(True); self.due_date_input.setDate(QDate.currentDate())
         add_button = QPushButton("Add Task"); add_button.clicked.connect(self.add_task)
         input_layout.addWidget(self.task_input, 1); input_layout.addWidget(self.due_date_input); input_layout.addWidget(add_button)
         delete_button = QPushButton("Delete Selected"); delete_button.clicked.connect(self.delete_task)
-        layout.addWidget(title); layout.addWidget(self.task_list_widget); layout.addLayout(input_layout); layout.addWidget(delete_button, 0, Qt.AlignmentFlag.AlignRight)
+        layout.addWidget(title); layout.addWidget(self.task_view); layout.addLayout(input_layout); layout.addWidget(delete_button, 0, Qt.AlignmentFlag.AlignRight)
         return page
 
     def create_ai_chat_page(self):
         page = QWidget(); layout = QVBoxLayout(page); layout.setContentsMargins(20, 20, 20, 20)
         title = QLabel("AI Chat"); title.setObjectName("PageTitle")
         model_area = QHBoxLayout(); model_label = QLabel("Select Model:"); self.model_selector = QComboBox()
-        model_area.addWidget(model_label); model_area.addWidget(self.model_selector); model_area.addStretch()
+        self.no_cache_checkbox = QCheckBox("Don't use cached answers")
+        model_area.addWidget(model_label); model_area.addWidget(self.model_selector); model_area.addStretch(); model_area.addWidget(self.no_cache_checkbox)
         self.ai_output_display = QTextEdit(); self.ai_output_display.setReadOnly(True)
+        # Chat output is written through this cursor, kept at the end of the document, instead of append().
+        self._end_cursor = QTextCursor(self.ai_output_display.document())
         self.command_input = QTextEdit(); self.command_input.setFixedHeight(120)
-        button_layout = QHBoxLayout(); export_button = QPushButton("Export Chat"); export_button.clicked.connect(self.export_chat_history)
-        send_button = QPushButton("Send to AI"); send_button.clicked.connect(self.handle_ai_request)
-        button_layout.addStretch(); button_layout.addWidget(export_button); button_layout.addWidget(send_button)
+        button_layout = QHBoxLayout(); self.export_button = QPushButton("Export Chat"); self.export_button.clicked.connect(self.export_chat_history)
+        self.send_button = QPushButton("Send to AI"); self.send_button.clicked.connect(self.handle_ai_request)
+        button_layout.addStretch(); button_layout.addWidget(self.export_button); button_layout.addWidget(self.send_button)
         layout.addWidget(title); layout.addLayout(model_area); layout.addWidget(self.ai_output_display, 1); layout.addWidget(self.command_input); layout.addLayout(button_layout)
         return page
 
@@ -170,151 +397,314 @@ class MainWindow(QMainWindow):
 
     # --- Core Logic ---
     def init_database(self):
-        self.db_conn = sqlite3.connect("smarttask.db");
+        # Autocommit mode: single statements commit on their own, multi-statement writes use transaction().
+        self.db_conn = sqlite3.connect("smarttask.db", isolation_level=None, cached_statements=256)
+        for pragma in SQLITE_PRAGMAS: self.db_conn.execute(pragma)
         self.update_database_schema()
-        cursor = self.db_conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS api_keys (service TEXT PRIMARY KEY, api_key TEXT)")
-        cursor.execute("CREATE TABLE IF NOT EXISTS app_config (key TEXT PRIMARY KEY, value TEXT)")
-        cursor.execute("INSERT OR IGNORE INTO app_config VALUES ('license_status', 'UNLICENSED')")
-        cursor.execute("INSERT OR IGNORE INTO app_config VALUES ('query_count', '0')")
-        cursor.execute("INSERT OR IGNORE INTO app_config VALUES ('last_query_reset', ?)", (datetime.now().strftime('%Y-%m'),))
-        self.db_conn.commit()
+        self.db_conn.execute("CREATE TABLE IF NOT EXISTS api_keys (service TEXT PRIMARY KEY, api_key TEXT)")
+        self.db_conn.execute("CREATE TABLE IF NOT EXISTS app_config (key TEXT PRIMARY KEY, value TEXT)")
+        self.db_conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (hash TEXT PRIMARY KEY, model TEXT, prompt TEXT, response TEXT, ts INTEGER)")
+        defaults = [('license_status', 'UNLICENSED'), ('query_count', '0'), ('last_query_reset', datetime.now().strftime('%Y-%m'))]
+        with self.transaction():
+            self.db_conn.executemany(SQL_SEED_CONFIG, defaults)
+            self.db_conn.execute(SQL_PRUNE_CACHE, (int(time.time()) - LLM_CACHE_TTL,))
+        # Both tables only change through this process, so reads are served from memory (write-through).
+        self._config_cache = dict(self.db_conn.execute(SQL_ALL_CONFIG))
+        self._api_keys = dict(self.db_conn.execute(SQL_ALL_API_KEYS))
+        self._current_month = None; self.roll_query_month()
 
     def update_database_schema(self):
-        cursor = self.db_conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, description TEXT, status TEXT DEFAULT 'pending')")
-        cursor.execute("PRAGMA table_info(tasks)")
-        columns = [info[1] for info in cursor.fetchall()]
+        self.db_conn.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, description TEXT, status TEXT DEFAULT 'pending')")
+        columns = [info[1] for info in self.db_conn.execute("PRAGMA table_info(tasks)")]
         if 'due_date' not in columns:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN due_date TEXT")
-        self.db_conn.commit()
+            self.db_conn.execute("ALTER TABLE tasks ADD COLUMN due_date TEXT")
+        # Covers SQL_PENDING_TASKS' WHERE and full ORDER BY (including the id DESC tie-break), so no sort step.
+        # Replaces the earlier (status, due_date) index; ANALYZE once when it is created.
+        if not self.db_conn.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_tasks_status_due_id'").fetchone():
+            self.db_conn.execute("DROP INDEX IF EXISTS idx_tasks_status_due")
+            self.db_conn.execute("CREATE INDEX idx_tasks_status_due_id ON tasks(status, due_date, id DESC)"); self.db_conn.execute("ANALYZE")
+
+    @contextmanager
+    def transaction(self):
+        # IMMEDIATE takes the write lock up front, avoiding a SQLITE_BUSY on the read-to-write upgrade.
+        self.db_conn.execute("BEGIN IMMEDIATE")
+        try: yield self.db_conn
+        except BaseException: self.db_conn.execute("ROLLBACK"); raise
+        else: self.db_conn.execute("COMMIT")
 
     def get_config(self, key):
-        cursor = self.db_conn.cursor(); cursor.execute("SELECT value FROM app_config WHERE key=?", (key,)); return (res[0] if (res := cursor.fetchone()) else None)
+        return self._config_cache.get(key)
     def set_config(self, key, value):
-        cursor = self.db_conn.cursor(); cursor.execute("INSERT OR REPLACE INTO app_config VALUES (?, ?)", (key, value)); self.db_conn.commit()
+        self.db_conn.execute(SQL_SET_CONFIG, (key, value)); self._config_cache[key] = value
+    def roll_query_month(self):
+        """Resets the free-tier query counter once when the calendar month changes."""
+        current_month = datetime.now().strftime('%Y-%m')
+        if current_month == self._current_month: return
+        self._current_month = current_month
+        if self.get_config('last_query_reset') != current_month:
+            with self.transaction(): self.set_config('query_count', '0'); self.set_config('last_query_reset', current_month)
+            if hasattr(self, 'status_bar'): self.update_status_bar()
     def update_status_bar(self):
-        status = self.get_config('license_status')
-        if status == 'PRO': self.status_bar.showMessage("Pro Version | Unlimited Queries")
+        if self.get_config('license_status') == 'PRO': self.status_bar.showMessage("Pro Version | Unlimited Queries")
         else: self.status_bar.showMessage(f"Free Version | Queries this month: {self.get_config('query_count')}/20")
     def activate_pro_license(self):
         key = self.license_input.text().strip().upper()
-        if key.startswith("SMARTTASK-") and len(key) > 15:
+        if LICENSE_KEY_RE.fullmatch(key):
             self.set_config('license_status', 'PRO'); QMessageBox.information(self, "Success", "Pro license activated!"); self.update_status_bar()
         else: QMessageBox.warning(self, "Error", "Invalid license key format.")
     def handle_ai_request(self):
-        if self.get_config('license_status') != 'PRO':
-            current_month = datetime.now().strftime('%Y-%m'); last_reset = self.get_config('last_query_reset')
-            if current_month != last_reset: self.set_config('query_count', '0'); self.set_config('last_query_reset', current_month)
-            query_count = int(self.get_config('query_count'))
-            if query_count >= 20: QMessageBox.warning(self, "Limit Reached", "Query limit (20) reached. Please upgrade to Pro."); return
-            self.set_config('query_count', str(query_count + 1)); self.update_status_bar()
         model = self.model_selector.currentText(); prompt = self.command_input.toPlainText().strip()
         if "No API" in model: self.status_bar.showMessage("Select a model in Settings.", 3000); return
         if not prompt: self.status_bar.showMessage("Please enter a prompt.", 3000); return
-        cursor = self.db_conn.cursor(); cursor.execute("SELECT api_key FROM api_keys WHERE service=?", (model,)); res = cursor.fetchone()
-        if not res: self.status_bar.showMessage(f"No API key for {model}.", 3000); return
-        self.ai_output_display.append(f"<b>You:</b> {prompt}"); QApplication.processEvents()
-        response = self.query_llm(model, prompt, res[0])
-        self.ai_output_display.append(f"<b>{model}:</b> {response}"); self.command_input.clear()
+        models = self.configured_models() if model == ALL_MODELS else [model]
+        if model != ALL_MODELS and not self._api_keys.get(model): self.status_bar.showMessage(f"No API key for {model}.", 3000); return
+        # The checkbox is read once here, so toggling it while a reply is in flight has no effect on that reply.
+        use_cache = not self.no_cache_checkbox.isChecked(); cache_keys = {name: self.llm_cache_key(name, prompt) if use_cache else "" for name in models}
+        cached = {name: hit for name in models if use_cache and (hit := self.get_cached_response(cache_keys[name])) is not None}
+        to_query = [name for name in models if name not in cached]
+        # Every provider call counts toward the free quota (an All Models send can make several); cache hits make none.
+        if to_query and self.get_config('license_status') != 'PRO':
+            query_count = int(self.get_config('query_count'))
+            if query_count >= 20: QMessageBox.warning(self, "Limit Reached", "Query limit (20) reached. Please upgrade to Pro."); return
+            if query_count + len(to_query) > 20:
+                QMessageBox.warning(self, "Limit Reached", f"This send needs {len(to_query)} queries but only {20 - query_count} remain this month. Pick a single model or upgrade to Pro."); return
+            self.set_config('query_count', str(query_count + len(to_query)))
+        self.append_chat_html(f"<b>You:</b> {self.plain_to_html(prompt)}"); self.command_input.clear()
+        for name, response in cached.items(): self.append_chat_html(f"<b>{name}</b> <i>(cached)</i><b>:</b> {self.response_html(response)}")
+        if not to_query: self.update_status_bar(); return
+        # A single model streams into a header shown up front; a fan-out runs all providers
+        # concurrently on the thread pool and shows each answer as it completes.
+        self._ai_streaming = len(to_query) == 1; self._ai_streamed = False; self._pending_queries = len(to_query)
+        self.send_button.setEnabled(False); self.status_bar.showMessage(f"Waiting for {', '.join(to_query)}...")
+        if self._ai_streaming: self.append_chat_html(f"<b>{to_query[0]}:</b>&nbsp;")
+        for name in to_query:
+            worker = LLMWorker(self.query_llm, name, prompt, self._api_keys[name], stream=self._ai_streaming, cache_key=cache_keys[name])
+            worker.signals.chunk.connect(self.handle_ai_chunk); worker.signals.finished.connect(self.handle_ai_response)
+            QThreadPool.globalInstance().start(worker)
+    def configured_models(self):
+        return [service for service in self.api_key_inputs if service in self._api_keys]
+    def handle_ai_chunk(self, text):
+        self._ai_streamed = True
+        self._end_cursor.movePosition(QTextCursor.MoveOperation.End); self._end_cursor.insertText(text, QTextCharFormat())
+        self.scroll_chat_to_end()
+    def handle_ai_response(self, model, prompt, response, cache_key):
+        if not self._ai_streaming: self.append_chat_html(f"<b>{model}:</b> {self.response_html(response)}")
+        # Streamed responses are already on screen; buffered ones and errors still need rendering.
+        elif not self._ai_streamed or self.is_error_response(response): self.append_chat_html(self.response_html(response), new_block=False)
+        if cache_key and not self.is_error_response(response): self.cache_response(cache_key, model, prompt, response)
+        self._pending_queries -= 1
+        if not self._pending_queries: self.send_button.setEnabled(True); self.update_status_bar()
+    def append_chat_html(self, html_text, new_block=True):
+        """Appends HTML at the end of the chat as one edit block, so the document is laid out once."""
+        cursor = self._end_cursor; cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        if new_block and not self.ai_output_display.document().isEmpty(): cursor.insertBlock()
+        cursor.insertHtml(html_text); cursor.endEditBlock()
+        self.scroll_chat_to_end()
+    def scroll_chat_to_end(self):
+        scrollbar = self.ai_output_display.verticalScrollBar(); scrollbar.setValue(scrollbar.maximum())
+    def is_error_response(self, response):
+        return response.startswith("<font color='red'>")
+    def plain_to_html(self, text):
+        return html.escape(text).replace("\n", "<br>")
+    def response_html(self, response):
+        """Renders a reply the way streaming shows it: literal text with its line breaks. Error messages are already HTML."""
+        return response if self.is_error_response(response) else self.plain_to_html(response)
+    def llm_cache_key(self, model, prompt):
+        # A custom endpoint's "API key" is its URL, so answers from a previous URL are never replayed.
+        scope = f"{model}@{self._api_keys.get(model, '')}" if model == "Custom Endpoint" else model
+        return hashlib.sha256(f"{scope}\n{prompt}".encode('utf-8')).hexdigest()
+    def get_cached_response(self, cache_key):
+        res = self.db_conn.execute(SQL_GET_CACHED_RESPONSE, (cache_key, int(time.time()) - LLM_CACHE_TTL)).fetchone()
+        return (res[0] if res else None)
+    def cache_response(self, cache_key, model, prompt, response):
+        self.db_conn.execute(SQL_CACHE_RESPONSE, (cache_key, model, prompt, response, int(time.time())))
     def load_tasks(self):
-        self.task_list_widget.clear(); cursor = self.db_conn.cursor()
-        for row in cursor.execute("SELECT id, description, due_date FROM tasks WHERE status='pending' ORDER BY due_date ASC, id DESC"):
-            task_id, description, due_date = row
-            display_text = f"{description}"
-            if due_date: display_text += f"  (Due: {due_date})"
-            item = QListWidgetItem(display_text); item.setData(Qt.ItemDataRole.UserRole, task_id); self.task_list_widget.addItem(item)
+        """Populates the task model from scratch; add/delete update it in place afterwards."""
+        self.task_model.set_rows(self.db_conn.execute(SQL_PENDING_TASKS).fetchall())
     def add_task(self):
         desc = self.task_input.text().strip()
         due_date = self.due_date_input.date().toString("yyyy-MM-dd")
         if desc:
-            cursor = self.db_conn.cursor(); cursor.execute("INSERT INTO tasks (description, due_date) VALUES (?, ?)", (desc, due_date))
-            self.db_conn.commit(); self.task_input.clear(); self.load_tasks(); self.status_bar.showMessage(f"Task added.", 2000)
+            cursor = self.db_conn.execute(SQL_INSERT_TASK, (desc, due_date))
+            self.task_model.insert_task(cursor.lastrowid, desc, due_date)
+            self.task_input.clear(); self.status_bar.showMessage(f"Task added.", 2000)
     def delete_task(self):
-        item = self.task_list_widget.currentItem()
-        if item: task_id = item.data(Qt.ItemDataRole.UserRole); cursor = self.db_conn.cursor(); cursor.execute("DELETE FROM tasks WHERE id=?", (task_id,)); self.db_conn.commit(); self.load_tasks(); self.status_bar.showMessage("Task deleted.", 2000)
+        index = self.task_view.currentIndex()
+        if index.isValid():
+            self.db_conn.execute(SQL_DELETE_TASK, (index.data(Qt.ItemDataRole.UserRole),))
+            self.task_model.remove_task(index.row()); self.status_bar.showMessage("Task deleted.", 2000)
     def handle_file_drop(self, filepath):
-        try:
-            self.status_bar.showMessage(f"Analyzing {os.path.basename(filepath)}...", 3000)
-            content = self.extract_text_from_file(filepath)
-            if content:
-                header = f"--- Context from {os.path.basename(filepath)} ---\n"; footer = "\n--- End of Context ---\n"
-                self.command_input.setPlainText(header + content + footer); self.status_bar.showMessage("File content loaded.", 4000)
-            else: QMessageBox.warning(self, "File Error", "Could not extract text from the file or file is empty.")
-        except Exception as e: QMessageBox.critical(self, "File Read Error", f"Failed to process file: {e}")
+        extension = os.path.splitext(filepath)[1].lower()
+        if extension not in self._extractors: self.status_bar.showMessage(f"Unsupported file type: {extension}", 3000); return
+        if not self.command_input.isEnabled(): self.status_bar.showMessage("Still extracting the previous file...", 3000); return
+        self.status_bar.showMessage(f"Extracting {os.path.basename(filepath)}..."); self.command_input.setEnabled(False)
+        worker = ExtractWorker(self.extract_text_from_file, filepath)
+        worker.signals.finished.connect(self.handle_extracted_text); worker.signals.failed.connect(self.handle_extract_failed)
+        QThreadPool.globalInstance().start(worker)
+    def handle_extracted_text(self, filepath, content):
+        self.command_input.setEnabled(True)
+        if content:
+            header = CONTEXT_HEADER.format(os.path.basename(filepath)) + "\n"; footer = f"\n{CONTEXT_FOOTER}\n"
+            # Mark a cut-off file in the prompt too, so the model doesn't take the excerpt for the whole document.
+            truncated = len(content) > MAX_CONTEXT_CHARS
+            if truncated: content = f"{content[:MAX_CONTEXT_CHARS]}\n{TRUNCATED_MARKER}"
+            self.command_input.setPlainText(header + content + footer)
+            self.status_bar.showMessage(f"File truncated to {MAX_CONTEXT_CHARS:,} characters." if truncated else "File content loaded.", 6000 if truncated else 4000)
+        else: self.status_bar.clearMessage(); QMessageBox.warning(self, "File Error", "Could not extract text from the file or file is empty.")
+    def handle_extract_failed(self, filepath, error):
+        self.command_input.setEnabled(True); self.status_bar.clearMessage()
+        QMessageBox.critical(self, "File Read Error", f"Failed to process file: {error}")
     def extract_text_from_file(self, filepath):
-        _, extension = os.path.splitext(filepath); extension = extension.lower()
-        if extension == '.txt':
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f: return f.read()
-        elif extension == '.csv':
-            with open(filepath, 'r', newline='', encoding='utf-8', errors='ignore') as f: return "\n".join([",".join(row) for row in csv.reader(f)])
-        elif extension == '.docx': return "\n".join([para.text for para in Document(filepath).paragraphs])
-        elif extension == '.pdf': return "\n".join([page.extract_text() or "" for page in PdfReader(filepath).pages])
-        else: self.status_bar.showMessage(f"Unsupported file type: {extension}", 3000); return None
+        """Returns the text of a supported file. Runs on a worker thread, so it must not touch widgets."""
+        extension = os.path.splitext(filepath)[1].lower()
+        handler = self._extractors.get(extension)
+        return handler(filepath) if handler else None
+    def _extract_txt(self, filepath):
+        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f: return f.read(EXTRACT_LIMIT)
+    def _extract_csv(self, filepath):
+        # CSV is already comma-separated text, which is exactly what the prompt needs; no need to re-serialize rows.
+        return self._extract_txt(filepath)
+    def _extract_docx(self, filepath):
+        from docx import Document
+        return join_bounded(para.text for para in Document(filepath).paragraphs)
+    def _extract_pdf(self, filepath):
+        # PDFium is much faster than PyPDF2; fall back to PyPDF2 if it is unavailable.
+        # Pages are generated lazily, so parsing stops once the context budget is full.
+        try: import pypdfium2 as pdfium
+        except ImportError:
+            from PyPDF2 import PdfReader
+            return join_bounded(page.extract_text() or "" for page in PdfReader(filepath).pages)
+        pdf = pdfium.PdfDocument(filepath)
+        try: return join_bounded(page.get_textpage().get_text_range() for page in pdf)
+        finally: pdf.close()
     def load_api_keys_to_inputs(self):
-        cursor = self.db_conn.cursor()
-        for row in cursor.execute("SELECT service, api_key FROM api_keys"):
-            if row[0] in self.api_key_inputs: self.api_key_inputs[row[0]].setText(row[1])
+        for service, api_key in self._api_keys.items():
+            if service in self.api_key_inputs: self.api_key_inputs[service].setText(api_key)
     def save_api_keys(self):
-        cursor = self.db_conn.cursor()
-        for service, field in self.api_key_inputs.items():
-            key = field.text().strip()
-            if key: cursor.execute("INSERT OR REPLACE INTO api_keys VALUES (?, ?)", (service, key))
-            else: cursor.execute("DELETE FROM api_keys WHERE service=?", (service,))
-        self.db_conn.commit(); self.status_bar.showMessage("API keys saved.", 3000); self.update_model_selector()
+        keys = {service: field.text().strip() for service, field in self.api_key_inputs.items()}
+        with self.transaction():
+            self.db_conn.executemany(SQL_SAVE_API_KEY, [(s, k) for s, k in keys.items() if k])
+            self.db_conn.executemany(SQL_DELETE_API_KEY, [(s,) for s, k in keys.items() if not k])
+        self._api_keys = {s: k for s, k in keys.items() if k}
+        self.status_bar.showMessage("API keys saved.", 3000); self.update_model_selector()
     def update_model_selector(self):
-        self.model_selector.clear(); cursor = self.db_conn.cursor()
-        keys = [row[0] for row in cursor.execute("SELECT service FROM api_keys")]
+        self.model_selector.clear()
+        keys = self.configured_models()
+        if len(keys) > 1: keys.append(ALL_MODELS)
         if keys: self.model_selector.addItems(keys); self.model_selector.setEnabled(True)
         else: self.model_selector.addItem("No API Keys Set"); self.model_selector.setEnabled(False)
-    def query_llm(self, model_name, prompt, api_key):
-        """Dispatches the AI query to the appropriate function based on the model name."""
+    def create_http_adapter(self):
+        """Creates the adapter shared by all LLM sessions, with pooled keep-alive connections and retries."""
+        # POST is retried too: a 429/5xx from these APIs means the completion was not produced.
+        # Read errors are never retried: a timed-out request may still be generating (and billing) the reply.
+        retry = Retry(total=2, connect=2, read=0, status=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset({"POST"}), raise_on_status=False)
+        return HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+
+    @property
+    def http(self):
+        """The calling thread's requests.Session; sessions aren't thread-safe, the pooled adapter they share is."""
+        session = getattr(self._http_local, 'session', None)
+        if session is None:
+            session = self._http_local.session = self.create_http_session()
+            with self._http_sessions_lock: self._http_sessions.add(session)
+        return session
+
+    def create_http_session(self):
+        session = requests.Session(); session.mount("https://", self.http_adapter); session.mount("http://", self.http_adapter)
+        # Set once for every request; the JSON Content-Type is added by requests itself via json=.
+        session.headers.update({"User-Agent": "SmartTask/1.0"})
+        return session
+
+    def query_llm(self, model_name, prompt, api_key, on_chunk=None):
+        """Dispatches the AI query to the appropriate function based on the model name.
+
+        Providers that support streaming pass partial text to on_chunk as it arrives.
+        A dropped-file context block is sent to the built-in providers as a separate
+        system prompt so repeated questions about the same file hit their prefix caches.
+        """
+        context, question = split_context(prompt)
         try:
-            if model_name == "OpenAI": return self.query_openai(prompt, api_key)
-            elif model_name == "Claude": return self.query_claude(prompt, api_key)
-            elif model_name == "Gemini": return self.query_gemini(prompt, api_key)
+            if model_name == "OpenAI": return self.query_openai(question, api_key, on_chunk, context)
+            elif model_name == "Claude": return self.query_claude(question, api_key, on_chunk, context)
+            elif model_name == "Gemini": return self.query_gemini(question, api_key, on_chunk, context)
             elif model_name == "Custom Endpoint": return self.query_custom(prompt, api_key)
             else: return f"Model '{model_name}' not implemented yet."
         except requests.exceptions.RequestException as e: return f"<font color='red'><b>Network Error:</b> {e}</font>"
         except Exception as e: return f"<font color='red'><b>Error:</b> {e}</font>"
 
-    def query_openai(self, prompt, api_key):
-        """Sends a request to the OpenAI Chat Completions API."""
+    def query_openai(self, prompt, api_key, on_chunk=None, context=""):
+        """Sends a request to the OpenAI Chat Completions API, streaming tokens to on_chunk if given."""
         endpoint = "https://api.openai.com/v1/chat/completions"
-        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-        data = {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": prompt}]}
-        response = requests.post(endpoint, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
-
-    def query_claude(self, prompt, api_key):
-        """Sends a request to the Anthropic Claude API."""
+        headers = {"Authorization": f"Bearer {api_key}"}
+        stream = on_chunk is not None
+        messages = ([{"role": "system", "content": context}] if context else []) + [{"role": "user", "content": prompt}]
+        data = {"model": "gpt-3.5-turbo", "messages": messages, "stream": stream}
+        # OpenAI caches long prompt prefixes automatically; the key routes follow-ups on one file together.
+        if context: data["prompt_cache_key"] = hashlib.sha256(context.encode('utf-8')).hexdigest()[:32]
+        with self.http.post(endpoint, headers=headers, json=data, timeout=30, stream=stream) as response:
+            response.raise_for_status()
+            if not stream: return response.json()['choices'][0]['message']['content']
+            parts = []
+            for event in self.iter_sse_events(response):
+                for choice in event.get('choices', []):
+                    if delta := choice.get('delta', {}).get('content'): parts.append(delta); on_chunk(delta)
+            return "".join(parts)
+
+    def query_claude(self, prompt, api_key, on_chunk=None, context=""):
+        """Sends a request to the Anthropic Claude API, streaming text deltas to on_chunk if given."""
         endpoint = "https://api.anthropic.com/v1/messages"
-        headers = {"x-api-key": api_key, "anthropic-version": "2023-06-01", "Content-Type": "application/json"}
+        headers = {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+        stream = on_chunk is not None
         data = {
             "model": "claude-3-sonnet-20240229", "max_tokens": 4096,
-            "messages": [{"role": "user", "content": prompt}]
+            "messages": [{"role": "user", "content": prompt}], "stream": stream
         }
-        response = requests.post(endpoint, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        return response.json()['content'][0]['text']
+        if context: data["system"] = [{"type": "text", "text": context, "cache_control": {"type": "ephemeral"}}]
+        with self.http.post(endpoint, headers=headers, json=data, timeout=30, stream=stream) as response:
+            response.raise_for_status()
+            if not stream: return response.json()['content'][0]['text']
+            parts = []
+            for event in self.iter_sse_events(response):
+                if event.get('type') == 'error': raise RuntimeError(event.get('error', {}).get('message', 'stream error'))
+                if event.get('type') == 'content_block_delta' and (delta := event['delta'].get('text')): parts.append(delta); on_chunk(delta)
+            return "".join(parts)
 
-    def query_gemini(self, prompt, api_key):
-        """Sends a request to the Google Gemini API."""
+    def query_gemini(self, prompt, api_key, on_chunk=None, context=""):
+        """Sends a request to the Google Gemini API, streaming text parts to on_chunk if given."""
         model = "gemini-1.5-flash-latest"
-        endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        headers = {"Content-Type": "application/json"}
-        params = {"key": api_key}
+        stream = on_chunk is not None
+        method = "streamGenerateContent" if stream else "generateContent"
+        endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}"
+        params = {"key": api_key, "alt": "sse"} if stream else {"key": api_key}
         data = {"contents": [{"parts": [{"text": prompt}]}]}
-        response = requests.post(endpoint, params=params, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        return response.json()['candidates'][0]['content']['parts'][0]['text']
+        if context: data["systemInstruction"] = {"parts": [{"text": context}]}
+        with self.http.post(endpoint, params=params, json=data, timeout=30, stream=stream) as response:
+            response.raise_for_status()
+            if not stream: return response.json()['candidates'][0]['content']['parts'][0]['text']
+            parts = []
+            for event in self.iter_sse_events(response):
+                for candidate in event.get('candidates', []):
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if delta := part.get('text'): parts.append(delta); on_chunk(delta)
+            return "".join(parts)
+
+    @staticmethod
+    def iter_sse_events(response):
+        """Yields the JSON payload of each server-sent "data:" line, stopping at OpenAI's [DONE] marker."""
+        response.encoding = 'utf-8'
+        for line in response.iter_lines(decode_unicode=True):
+            if not line.startswith("data:"): continue
+            payload = line[5:].strip()
+            if payload == "[DONE]": return
+            if payload: yield json.loads(payload)
 
     def query_custom(self, prompt, url):
         """Sends a request to a user-defined custom endpoint."""
         try:
             data = {"prompt": prompt}
-            response = requests.post(url, json=data, timeout=30)
+            response = self.http.post(url, json=data, timeout=30)
             response.raise_for_status()
             json_response = response.json()
             return json_response.get("response", json_response.get("text", str(json_response)))
@@ -323,33 +713,31 @@ class MainWindow(QMainWindow):
     def toggle_theme(self):
         self.current_theme = 'light' if self.current_theme == 'dark' else 'dark'; self.apply_theme(self.current_theme)
     def apply_theme(self, theme):
-        base = "QPushButton { border-radius: 5px; padding: 8px; font-weight: bold; } QListWidget, QTextEdit, QLineEdit, QDateEdit { border-radius: 5px; padding: 5px; } #SidebarTitle { font-size: 18pt; font-weight: bold; } #PageTitle { font-size: 14pt; font-weight: bold; margin-bottom: 10px; }"
-        light = base + "QWidget { background-color: #f0f2f5; color: #333; } QTextEdit, QLineEdit, QListWidget, QDateEdit { background-color: #fff; border: 1px solid #d9d9d9; } QPushButton { background-color: #007bff; color: white; border: none; } QPushButton:hover { background-color: #0056b3; } QStatusBar { background-color: #e9ecef; } #sidebar { background-color: #fff; }"
-        dark = base + "QWidget { background-color: #1c1c1e; color: #f0f0f0; } QTextEdit, QLineEdit, QListWidget, QDateEdit { background-color: #2c2c2e; border: 1px solid #444; } QPushButton { background-color: #0a84ff; color: white; border: none; } QPushButton:hover { background-color: #0060df; } QStatusBar { background-color: #2c2c2e; } #sidebar { background-color: #232325; }"
-        self.setStyleSheet(dark if theme == 'dark' else light)
-        self.sidebar.setObjectName("sidebar")
-        # The unpolish/polish calls can be unstable on some systems.
-        # Removing them for a more robust, if slightly less dynamic, theme switch.
-        # self.style().unpolish(self)
-        # self.style().polish(self)
+        # setStyleSheet repolishes the widget tree itself; explicit unpolish/polish was unstable on some systems.
+        self.setStyleSheet(DARK_QSS if theme == 'dark' else LIGHT_QSS)
     def export_chat_history(self):
         content = self.ai_output_display.toPlainText()
         if not content.strip(): QMessageBox.information(self, "Export Empty", "There is no chat history to export."); return
         file_path, selected_filter = QFileDialog.getSaveFileName(self, "Export Chat History", "", "PDF (*.pdf);;Word Document (*.docx);;Markdown (*.md)")
         if not file_path: return
-        try:
-            if selected_filter == "PDF (*.pdf)": self.export_to_pdf(content, file_path)
-            elif selected_filter == "Word Document (*.docx)": self.export_to_docx(content, file_path)
-            elif selected_filter == "Markdown (*.md)": self.export_to_md(content, file_path)
-            self.status_bar.showMessage(f"Chat exported to {os.path.basename(file_path)}", 4000)
-        except Exception as e: QMessageBox.critical(self, "Export Error", f"Failed to export file.\nError: {e}")
+        exporters = {"PDF (*.pdf)": self.export_to_pdf, "Word Document (*.docx)": self.export_to_docx, "Markdown (*.md)": self.export_to_md}
+        if not (export_fn := exporters.get(selected_filter)): return
+        self.export_button.setEnabled(False); self.status_bar.showMessage(f"Exporting to {os.path.basename(file_path)}...")
+        worker = ExportWorker(export_fn, content, file_path); worker.signals.done.connect(self.handle_export_done)
+        QThreadPool.globalInstance().start(worker)
+    def handle_export_done(self, ok, detail):
+        self.export_button.setEnabled(True)
+        if ok: self.status_bar.showMessage(f"Chat exported to {os.path.basename(detail)}", 4000)
+        else: self.status_bar.clearMessage(); QMessageBox.critical(self, "Export Error", f"Failed to export file.\nError: {detail}")
     def export_to_md(self, content, filepath):
         with open(filepath, 'w', encoding='utf-8') as f: f.write(content)
     def export_to_docx(self, content, filepath):
+        from docx import Document
         doc = Document(); doc.add_paragraph(content); doc.save(filepath)
     def export_to_pdf(self, content, filepath):
-        pdf = FPDF(font_cache_dir=True); pdf.add_page()
-        pdf.add_font('DejaVu', '', 'DejaVuSans.ttf'); pdf.set_font('DejaVu', '', 12)
+        from fpdf import FPDF
+        pdf = FPDF(); pdf.add_page()
+        pdf.add_font('DejaVu', '', get_pdf_font_path()); pdf.set_font('DejaVu', '', 12)
         pdf.multi_cell(0, 10, content); pdf.output(filepath)
 
 if __name__ == '__main__':
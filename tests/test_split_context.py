@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("PyQt6")
+pytest.importorskip("requests")
+
+from smarttask_ai import CONTEXT_FOOTER, CONTEXT_HEADER, split_context
+
+
+def build_prompt(name, content, question):
+    # Mirrors MainWindow.handle_extracted_text plus the user's typed question.
+    header = CONTEXT_HEADER.format(name) + "\n"; footer = f"\n{CONTEXT_FOOTER}\n"
+    return (header + content + footer + question).strip()
+
+
+def test_split_context_separates_file_and_question():
+    context, question = split_context(build_prompt("notes.txt", "line one\nline two", "Summarize this."))
+    assert context == f"{CONTEXT_HEADER.format('notes.txt')}\nline one\nline two\n{CONTEXT_FOOTER}"
+    assert question == "Summarize this."
+
+
+def test_split_context_keeps_marker_inside_file_body():
+    body = f"before\n{CONTEXT_FOOTER}\nafter"
+    context, question = split_context(build_prompt("doc.txt", body, "What comes after?"))
+    assert context == f"{CONTEXT_HEADER.format('doc.txt')}\n{body}\n{CONTEXT_FOOTER}"
+    assert question == "What comes after?"
+
+
+def test_split_context_without_question_or_context():
+    prompt = build_prompt("doc.txt", "body", "")
+    assert split_context(prompt) == ("", prompt)
+    assert split_context("Just a question") == ("", "Just a question")